@@ -13,6 +13,7 @@ let pythonpath = String.concat ":" [
   "/tmp/cartpipeline/src/pyagg";
 ];;
 let projectpath = "/Users/eczech/projects/hammer/";;
+let expression_workers = 4;;
 
 (* Parse tcga study id strings from arguments (can be any number of them) *)
 let tcga_studies =
@@ -55,24 +56,26 @@ let run_pipeline () =
       ~name:"Gene Meta Generation"
       ~make: (dockerize (pypgm
         "pyhpa/script/gene_selector.py"
-        "--output /tmp/cartpipeline/data/gene_meta.csv"
+        "--output /tmp/cartpipeline/data/gene_meta.csv --skip-existing"
       )) in
 
   (* Use gene/protein data to define scope of TCGA data collection and
-  that collection for each TCGA study as a separate node *)
-  let collect_expression = List.map (fun study_id ->
+  run that collection for all TCGA studies in a single node, fanned out
+  across a local worker pool (one output file is written per study) *)
+  let collect_expression =
     workflow_node without_product
-      ~name:(sprintf "Expression Data Collection (%s)" study_id)
+      ~name:"Expression Data Collection"
       ~edges:[depends_on collect_meta]
       ~make: (dockerize (pypgm
         "pycgds/script/tcga_expression.py" (sprintf
           "--study-id %s \
-          --output /tmp/cartpipeline/data/expression_data_%s.csv \
+          --workers %d \
+          --output /tmp/cartpipeline/data/expression_data_{study_id}.csv \
           --gene-meta-path /tmp/cartpipeline/data/gene_meta.csv \
-          --cache-dir /tmp/tcgacache" study_id study_id
+          --cache-dir /tmp/tcgacache \
+          --skip-existing" (String.concat " " tcga_studies) expression_workers
         )
-      ))
-    ) tcga_studies in
+      )) in
 
   (* Aggregate all TCGA data and combine with gene/protein metadata *)
   let expression_paths = String.concat " " (
@@ -83,7 +86,7 @@ let run_pipeline () =
   let aggregate =
     workflow_node without_product
       ~name:"Result Aggregation"
-      ~edges:(List.map depends_on collect_expression)
+      ~edges:[depends_on collect_expression]
       ~make: (dockerize (pypgm
         "pyagg/script/aggregation.py" (sprintf
           "--gene-meta-path /tmp/cartpipeline/data/gene_meta.csv \
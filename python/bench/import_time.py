@@ -0,0 +1,93 @@
+"""
+Import-time benchmark for pipeline script startup
+
+Each pipeline step runs as a separate, short-lived process (one Docker container per Ketrew node) so
+interpreter and import startup is paid on every node.  This measures cold-start time for each CLI module
+in a fresh interpreter and verifies that none of them load pandas or numpy before they are needed.  The heavy
+modules must be importable in the benchmark environment, otherwise that check would pass trivially.
+
+Usage:
+    python bench/import_time.py [--repeats N]
+"""
+import os
+import sys
+import json
+import time
+import subprocess
+from argparse import ArgumentParser
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE_DIRS = [os.path.join(ROOT_DIR, p) for p in ['pyhpa', 'pycgds', 'pyagg']]
+
+# CLI-facing modules imported by the scripts in */script/*.py
+CLI_MODULES = ['pyhpa.gene_selector', 'pycgds.tcga_expression', 'pyagg.aggregation']
+
+# Modules that should never be loaded just to parse arguments
+HEAVY_MODULES = ['pandas', 'numpy']
+
+PROBE = (
+    'import sys, time, json; t = time.perf_counter(); import {module}; '
+    'print(json.dumps({{"secs": time.perf_counter() - t, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))'
+)
+
+
+def get_env():
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(PACKAGE_DIRS + [env.get('PYTHONPATH', '')])
+    return env
+
+
+def get_missing_heavy_modules():
+    # Run in a fresh interpreter so that this process does not load the modules itself
+    missing = []
+    for module in HEAVY_MODULES:
+        if subprocess.call([sys.executable, '-c', 'import ' + module], env=get_env(),
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) != 0:
+            missing.append(module)
+    return missing
+
+
+def run_probe(module):
+    start = time.perf_counter()
+    out = subprocess.check_output(
+        [sys.executable, '-c', PROBE.format(module=module, heavy=HEAVY_MODULES)],
+        env=get_env(), universal_newlines=True
+    )
+    res = json.loads(out)
+    res['process_secs'] = time.perf_counter() - start
+    return res
+
+
+def make_arg_parser():
+    parser = ArgumentParser()
+    parser.add_argument(
+        "--repeats",
+        default=5,
+        type=int,
+        help="Number of fresh interpreters to start per module (best time is reported)"
+    )
+    return parser
+
+if __name__ == "__main__":
+    args = make_arg_parser().parse_args()
+
+    missing = get_missing_heavy_modules()
+    if len(missing) > 0:
+        print('Heavy modules {} are not importable in this environment so deferred imports cannot be '
+              'verified; install them and re-run'.format(missing), file=sys.stderr)
+        sys.exit(2)
+
+    failed = False
+    print('{:<28} {:>12} {:>14}  {}'.format('module', 'import (ms)', 'process (ms)', 'heavy modules loaded'))
+    for module in CLI_MODULES:
+        runs = [run_probe(module) for _ in range(args.repeats)]
+        heavy = sorted(set(m for r in runs for m in r['heavy']))
+        failed = failed or len(heavy) > 0
+        print('{:<28} {:>12.1f} {:>14.1f}  {}'.format(
+            module,
+            1000 * min(r['secs'] for r in runs),
+            1000 * min(r['process_secs'] for r in runs),
+            ', '.join(heavy) or '-'
+        ))
+
+    sys.exit(1 if failed else 0)
@@ -1,6 +1,6 @@
 
-import pandas as pd
-import numpy as np
+import os
+import tempfile
 import logging
 logger = logging.getLogger(__name__)
 
@@ -23,6 +23,7 @@ def add_args(parser):
 
 
 def get_gene_meta(path):
+    import pandas as pd
 
     # Read in raw gene meta data frame and subset to relevant fields
     d = pd.read_csv(path)
@@ -48,7 +49,30 @@ def get_gene_meta(path):
     return d
 
 
+def _get_exp_stat_percentiles():
+    import numpy as np
+    return list(np.arange(.1, 1, .1)) + [.95, .99]
+
+
+def _get_exp_stat_name(name):
+    # For some reason, percentiles occasionally have .0 suffixed to them due to rounding (so remove that)
+    return name.replace('.0', '').title()
+
+
+def get_exp_stat_columns():
+    """
+    Get the names of the expression statistic fields produced by `get_exp_stats`
+
+    :return: List of statistic names (e.g. "Count", "Mean", "10%", ..., "Max")
+    """
+    import pandas as pd
+    stats = pd.Series([], dtype=float).describe(percentiles=_get_exp_stat_percentiles())
+    return [_get_exp_stat_name(c) for c in stats.index]
+
+
 def get_exp_stats(path):
+    import pandas as pd
+
     d = pd.read_csv(path)
 
     # It is assumed that this data never contains duplicates, but verify that here to be sure
@@ -57,29 +81,153 @@ def get_exp_stats(path):
     # Group by study name and gene and calculate statistics for expression levels
     d = (
         d.groupby(['StudyId', 'Gene'])['Value']
-        .describe(percentiles=list(np.arange(.1, 1, .1)) + [.95, .99])
+        .describe(percentiles=_get_exp_stat_percentiles())
     )
-
-    # For some reason, percentiles occasionally have .0 suffixed to them due to rounding (so remove that)
-    d = d.rename(columns=lambda c: c.replace('.0', '').title())
+    d = d.rename(columns=_get_exp_stat_name)
 
     return d
 
 
-def merge(d_gene, d_exp):
+def get_gene_meta_index(d_gene):
+    """
+    Index gene metadata by gene symbol for repeated joins against expression statistics
+
+    :param d_gene: Data frame from `get_gene_meta`
+    :return: Data frame indexed by (unique) gene symbol
+    :raises ValueError: If any gene symbol is present more than once
+    """
+    dupe_genes = list(d_gene['Gene'][d_gene['Gene'].duplicated()].unique())
+    if len(dupe_genes) > 0:
+        raise ValueError('Gene metadata must contain one record per gene (duplicated genes = "{}")'
+                         .format(dupe_genes))
+    return d_gene.set_index('Gene')
+
+
+def get_result_columns(d_meta, stat_columns):
+    """
+    Get the names of the fields in merged gene metadata and expression statistics
+
+    :param d_meta: Data frame from `get_gene_meta_index`
+    :param stat_columns: Names of expression statistic fields (see `get_exp_stat_columns`)
+    :return: List of field names
+    """
+    return ['Gene'] + ['Meta:' + c for c in d_meta.columns] + ['StudyId'] + ['Stat:' + c for c in stat_columns]
+
+
+def merge_shard(d_meta, d_exp):
+    """
+    Inner join indexed gene metadata with expression statistics for a single study
+
+    Matching is done by position against the gene metadata index so that only the matched rows of each
+    column are materialized once, in the result, rather than through intermediate re-indexed copies of
+    either frame.  Result rows follow the order of the gene metadata.
+
+    :param d_meta: Data frame from `get_gene_meta_index`
+    :param d_exp: Data frame from `get_exp_stats`, restricted to one study (indexed by StudyId and Gene)
+    :return: Data frame with "Gene", "Meta:" prefixed metadata fields, "StudyId" and "Stat:" prefixed statistics
+    """
+    import pandas as pd
+    import numpy as np
+
     # Combine gene meta data with expression data, merging on gene symbol (not id of some kind)
     # and for now, ignore any matches from either side (inner join)
     # TODO: Analyze unjoined genes from these data sets to see if any are recoverable
-    d = pd.merge(
-        d_gene.set_index('Gene').add_prefix('Meta:').reset_index(),
-        d_exp.add_prefix('Stat:').reset_index(level='StudyId').reset_index(),
-        how='inner',
-        on='Gene'
-    )
-    return d
+    idx = d_meta.index.get_indexer(d_exp.index.get_level_values('Gene'))
+    pos_exp = np.flatnonzero(idx >= 0)
+    order = np.argsort(idx[pos_exp], kind='mergesort')
+    pos_meta, pos_exp = idx[pos_exp][order], pos_exp[order]
+
+    columns = get_result_columns(d_meta, d_exp.columns)
+    data = {
+        'Gene': d_meta.index.values[pos_meta],
+        'StudyId': d_exp.index.get_level_values('StudyId').values[pos_exp]
+    }
+    data.update({'Meta:' + c: d_meta[c].values[pos_meta] for c in d_meta.columns})
+    data.update({'Stat:' + c: d_exp[c].values[pos_exp] for c in d_exp.columns})
+    return pd.DataFrame(data, columns=columns)
+
+
+def iter_merged_shards(d_meta, exp_paths):
+    """
+    Generate merged gene metadata and expression statistics, one study at a time
+
+    Only the expression data from one path and the merged result for one study are held in memory at once.
+
+    :param d_meta: Data frame from `get_gene_meta_index`
+    :param exp_paths: Path(s) to CSV files containing TCGA expression data
+    :return: Generator of (study id, merged data frame) tuples
+    """
+    for path in exp_paths:
+        d_exp = get_exp_stats(path)
+        if len(d_exp) == 0:
+            logger.warning('No expression data found in "{}"'.format(path))
+            continue
+        for study_id, d_shard in d_exp.groupby(level='StudyId'):
+            d = merge_shard(d_meta, d_shard)
+            logger.info('Merged {} genes with gene metadata for study "{}"'.format(len(d), study_id))
+            yield study_id, d
+
+
+def merge(d_gene, d_exp):
+    """
+    Inner join gene metadata with expression statistics for all studies
+
+    :param d_gene: Data frame from `get_gene_meta`; genes must be unique
+    :param d_exp: Data frame from `get_exp_stats` (indexed by StudyId and Gene)
+    :return: Data frame with "Gene", "Meta:" prefixed metadata fields, "StudyId" and "Stat:" prefixed statistics
+    """
+    import pandas as pd
+
+    d_meta = get_gene_meta_index(d_gene)
+    shards = [merge_shard(d_meta, d_shard) for _, d_shard in d_exp.groupby(level='StudyId')]
+    if len(shards) == 0:
+        return pd.DataFrame(columns=get_result_columns(d_meta, d_exp.columns))
+    return pd.concat(shards, ignore_index=True)
 
 
 def aggregate_pipeline_results(args):
-    d_gene = get_gene_meta(args.gene_meta_path)
-    d_exp = pd.concat([get_exp_stats(path) for path in args.gene_exp_paths])
-    return merge(d_gene, d_exp)
+    import pandas as pd
+
+    d_meta = get_gene_meta_index(get_gene_meta(args.gene_meta_path))
+    shards = [d for _, d in iter_merged_shards(d_meta, args.gene_exp_paths)]
+    if len(shards) == 0:
+        return pd.DataFrame(columns=get_result_columns(d_meta, get_exp_stat_columns()))
+    return pd.concat(shards, ignore_index=True)
+
+
+def write_pipeline_results(args, path):
+    """
+    Merge gene metadata with expression statistics and write the result to CSV, one study at a time
+
+    Each study is appended to the output as soon as it is merged so that peak memory is bounded
+    by a single study rather than the whole merged table.  Results are written to a temporary file
+    in the same directory and only moved to `path` once complete.
+
+    :param args: Parsed arguments from `add_args`
+    :param path: Path of CSV file to write
+    :return: Number of records written
+    """
+    import pandas as pd
+
+    d_meta = get_gene_meta_index(get_gene_meta(args.gene_meta_path))
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    os.close(fd)
+    try:
+        n, first = 0, True
+        for _, d in iter_merged_shards(d_meta, args.gene_exp_paths):
+            d.to_csv(tmp_path, index=False, header=first, mode='w' if first else 'a')
+            n, first = n + len(d), False
+        if first:
+            logger.warning('No expression statistics found to merge so "{}" will only contain a header'.format(path))
+            pd.DataFrame(columns=get_result_columns(d_meta, get_exp_stat_columns())).to_csv(tmp_path, index=False)
+
+        # mkstemp creates files readable only by the owner so restore the mode a plain write would have
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_path, 0o666 & ~umask)
+
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return n
@@ -1,7 +1,8 @@
+import os
+import sys
 import logging
-from io import StringIO
 from argparse import ArgumentParser
-from pyagg.aggregation import add_args, aggregate_pipeline_results
+from pyagg.aggregation import add_args, write_pipeline_results
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +15,11 @@ def make_arg_parser():
         metavar='PATH',
         help="Name of CSV file to contain aggregated pipeline data"
     )
+    parser.add_argument(
+        "--skip-existing",
+        action='store_true',
+        help="Exit immediately (before loading pandas) if the output file already exists"
+    )
     return parser
 
 if __name__ == "__main__":
@@ -22,13 +28,10 @@ if __name__ == "__main__":
     args = parser.parse_args()
     logger.info('Pipeline aggregation arguments: {}'.format(args))
 
-    # Run selection
-    df = aggregate_pipeline_results(args)
-
-    # Print result info
-    info = StringIO()
-    df.info(buf=info)
-    logging.info('Pipeline aggregation result info:\n{}'.format(info.getvalue()))
+    if args.skip_existing and os.path.exists(args.output):
+        logger.info('Output "{}" already exists; skipping pipeline aggregation'.format(args.output))
+        sys.exit(0)
 
-    # Write results to file
-    df.to_csv(args.output, index=False)
\ No newline at end of file
+    # Run aggregation, writing results to file one study at a time
+    n = write_pipeline_results(args, args.output)
+    logging.info('Pipeline aggregation wrote {} records to "{}"'.format(n, args.output))
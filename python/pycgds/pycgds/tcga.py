@@ -5,6 +5,102 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+def get_cancer_study_ids():
+    """
+    Fetch the identifiers of all cancer studies known to cBioPortal
+
+    :return: Array of unique cancer study identifiers
+    """
+    return api.get_cancer_studies()['cancer_study_id'].unique()
+
+
+def validate_study_id(study_id, data_type, cancer_study_ids):
+    """
+    Validate a single TCGA study identifier for the given data type
+
+    Study ids should be something like "kich_tcga", "kirc_tcga", "ucec_tcga_pub", etc where tcga is a substring
+    in the id, and they should be present within CGDS as well as have data for the given genetic data type.
+
+    :param study_id: TCGA-related cancer study identifier (e.g. "kich_tcga")
+    :param data_type: Type of genetic data to fetch (see module constants prefixed by DATA_TYPE.* for possibilities)
+    :param cancer_study_ids: Known cBioPortal study identifiers (from `get_cancer_study_ids`); passing these in
+        allows the same metadata to be shared across validation of many studies
+    :return: True if the study has data for the given type, False otherwise
+    :raises ValueError: If the study id does not pertain to TCGA or is unknown to cBioPortal
+    """
+    # Check for tcga substring
+    if 'tcga' not in study_id:
+        raise ValueError('Study Id "{}" is not valid in this context because it does not pertain '
+                         'to TCGA studies'.format(study_id))
+    # Check that this study actual exists
+    if study_id not in cancer_study_ids:
+        raise ValueError('Study Id "{}" is not a known identifier within cBioPortal'.format(study_id))
+
+    # Check that the requested data actually exists for this study
+    genetic_profile_id = study_id + '_' + data_type
+    genetic_profiles = api.get_genetic_profiles(study_id)['genetic_profile_id'].unique()
+    if genetic_profile_id not in genetic_profiles:
+        logging.warning('TCGA study id "{}" does not have data for type "{}" so it will '
+                        'be ignored'.format(study_id, data_type))
+        return False
+    return True
+
+
+def get_study_data(study_id, data_type, gene_ids, batch_size=50, cache_dir=None):
+    """
+    Fetch raw data for a single, already validated TCGA study
+
+    :param study_id: TCGA-related cancer study identifier (e.g. "kich_tcga")
+    :param data_type: Type of genetic data to fetch (see module constants prefixed by DATA_TYPE.* for possibilities)
+    :param gene_ids: List of gene names to collect data for
+    :param batch_size: Size of batch requests (in terms of genes) submitted to CGDS
+    :param cache_dir: Optional location of directory in which unique calls will be cached
+    :return: Data frame in wide format (one column per sample) with a "STUDY_ID" field, or None if
+        no data was found for the study
+    """
+    # Create a CGDS genetic profile (eg "lusc_tcga_mrna")
+    genetic_profile_id = study_id + '_' + data_type
+
+    # Create a CGDS case list id (eg "lusc_tcga_all")
+    case_list_id = study_id + '_all'
+
+    # Invoke CGDS web service through batch, possibly cached requests (if cache_dir set)
+    d = api.get_genetic_profile_data(
+        case_list_id, genetic_profile_id, gene_ids,
+        batch_size=batch_size, cache_dir=cache_dir
+    )
+
+    if len(d) == 0:
+        return None
+    return d.assign(STUDY_ID=study_id)
+
+
+def prepare_data(data):
+    """
+    Combine and reshape raw study data into long format
+
+    :param data: List of non-empty data frames from `get_study_data`
+    :return: Data frame containing study id, gene, and value for each TCGA sample
+    """
+    # Concatenate results from all TCGA studies
+    d = pd.concat(data).rename(columns={'COMMON': 'GENE'})
+
+    # Assert that gene ids and names are unique to one another
+    assert d.groupby(['GENE'])['GENE_ID'].nunique().max() == 1
+    assert d.groupby(['GENE_ID'])['GENE'].nunique().max() == 1
+
+    # Assert that there are no duplicates per study + gene
+    assert d.groupby(['STUDY_ID', 'GENE_ID', 'GENE']).size().max() == 1
+
+    # Stack result to transfrom sample ids out of columns (ie convert data to long format)
+    d = d.set_index(['STUDY_ID', 'GENE_ID', 'GENE'])
+    d.columns.name = 'SAMPLE_ID'
+    d = d.stack().rename('VALUE')
+
+    # Rename upper-underscore fields and return result
+    return d.reset_index().rename(columns=lambda c: c.title().replace('_', ''))
+
+
 def get_data(tcga_study_ids, data_type, gene_ids, batch_size=50, cache_dir=None):
     """
     Fetch TCGA study data using the cBioPortal (aka CGDS) web service
@@ -18,29 +114,12 @@ def get_data(tcga_study_ids, data_type, gene_ids, batch_size=50, cache_dir=None)
     :return: Data frame containing study id, gene, and value for each TCGA sample
     """
 
-    # Validate the given list of study identifiers (they should all be something like "kich_tcga", "kirc_tcga",
-    # "ucec_tcga_pub", etc where tcga is a substring in the id) and they should all be present within CGDS as
-    # well as have data for the given genetic data type
-    cancer_studies = api.get_cancer_studies()['cancer_study_id'].unique()
-    valid_study_ids = []
-    for study_id in tcga_study_ids:
-        # Check for tcga substring
-        if 'tcga' not in study_id:
-            raise ValueError('Study Id "{}" is not valid in this context because it does not pertain '
-                             'to TCGA studies'.format(study_id))
-        # Check that this study actual exists
-        if study_id not in cancer_studies:
-            raise ValueError('Study Id "{}" is not a known identifier within cBioPortal'.format(study_id))
-
-        # Check that the requested data actually exists for this study
-        genetic_profile_id = study_id + '_' + data_type
-        genetic_profiles = api.get_genetic_profiles(study_id)['genetic_profile_id'].unique()
-        if genetic_profile_id not in genetic_profiles:
-            logging.warning('TCGA study id "{}" does not have data for type "{}" so it will '
-                            'be ignored'.format(study_id, data_type))
-            continue
-
-        valid_study_ids.append(study_id)
+    # Validate the given list of study identifiers
+    cancer_study_ids = get_cancer_study_ids()
+    valid_study_ids = [
+        study_id for study_id in tcga_study_ids
+        if validate_study_id(study_id, data_type, cancer_study_ids)
+    ]
 
     # Raise if none of the given studies could be validated
     if len(valid_study_ids) == 0:
@@ -52,49 +131,19 @@ def get_data(tcga_study_ids, data_type, gene_ids, batch_size=50, cache_dir=None)
     data = []
 
     for i, study_id in enumerate(valid_study_ids):
-
-        # Create a CGDS genetic profile (eg "lusc_tcga_mrna")
-        genetic_profile_id = study_id + '_' + data_type
-
-        # Create a CGDS case list id (eg "lusc_tcga_all")
-        case_list_id = study_id + '_all'
-
         logger.info(
             'Importing data for study "{}" ({} of {}) -> profile="{}"'
-            .format(study_id, i + 1, len(tcga_study_ids), genetic_profile_id)
+            .format(study_id, i + 1, len(tcga_study_ids), study_id + '_' + data_type)
         )
-
-        # Invoke CGDS web service through batch, possibly cached requests (if cache_dir set)
-        d = api.get_genetic_profile_data(
-            case_list_id, genetic_profile_id, gene_ids,
-            batch_size=batch_size, cache_dir=cache_dir
-        )
-
-        if len(d) == 0:
-            continue
-        data.append(d.assign(STUDY_ID=study_id))
+        d = get_study_data(study_id, data_type, gene_ids, batch_size=batch_size, cache_dir=cache_dir)
+        if d is not None:
+            data.append(d)
 
     # Raise on empty results (before transformations/assertions that will fail otherwise)
     if len(data) == 0:
         raise ValueError('No data found for study ids = "{}", data type = "{}"'.format(tcga_study_ids, data_type))
 
-    # Concatenate results from all TCGA studies
-    d = pd.concat(data).rename(columns={'COMMON': 'GENE'})
-
-    # Assert that gene ids and names are unique to one another
-    assert d.groupby(['GENE'])['GENE_ID'].nunique().max() == 1
-    assert d.groupby(['GENE_ID'])['GENE'].nunique().max() == 1
-
-    # Assert that there are no duplicates per study + gene
-    assert d.groupby(['STUDY_ID', 'GENE_ID', 'GENE']).size().max() == 1
-
-    # Stack result to transfrom sample ids out of columns (ie convert data to long format)
-    d = d.set_index(['STUDY_ID', 'GENE_ID', 'GENE'])
-    d.columns.name = 'SAMPLE_ID'
-    d = d.stack().rename('VALUE')
-
-    # Rename upper-underscore fields and return result
-    return d.reset_index().rename(columns=lambda c: c.title().replace('_', ''))
+    return prepare_data(data)
 
 
 #-------------------------#
@@ -1,6 +1,21 @@
 
-from pycgds import tcga as tcga_data
-import pandas as pd
+from collections import namedtuple, OrderedDict
+import os
+import tempfile
+import logging
+logger = logging.getLogger(__name__)
+
+# Per-study exit codes
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_INVALID_STUDY = 2
+EXIT_NO_DATA = 3
+
+# Placeholder in output paths indicating that one file should be written per study
+STUDY_ID_PLACEHOLDER = '{study_id}'
+
+StudyResult = namedtuple('StudyResult', ['study_id', 'exit_code', 'data'])
+
 
 def add_args(parser):
     parser.add_argument(
@@ -18,8 +33,16 @@ def add_args(parser):
     parser.add_argument(
         '--study-id',
         required=True,
+        nargs='+',
         metavar='STUDYID',
-        help='Name of TCGA cohort/study id (eg prad_tcga or prad_tcga_pub)'
+        help='Name(s) of TCGA cohort/study id (eg prad_tcga or prad_tcga_pub)'
+    )
+    parser.add_argument(
+        '--workers',
+        default=1,
+        type=int,
+        metavar='N',
+        help='Number of processes used to collect data for multiple studies in parallel (defaults to 1)'
     )
     parser.add_argument(
         '--use-rna-seq',
@@ -30,16 +53,166 @@ def add_args(parser):
     return parser
 
 
+def get_data_type(args):
+    from pycgds import tcga as tcga_data
+    return tcga_data.DATA_TYPE_RNASEQ_ZSCORE if args.use_rna_seq else tcga_data.DATA_TYPE_EXPRESSION_ZSCORE
+
+
 def get_expression_data(args):
-    gene_meta_path = args.gene_meta_path
-    use_rna_seq = args.use_rna_seq
-    study_id = args.study_id
-    cache_dir = args.cache_dir
+    from pycgds import tcga as tcga_data
+    import pandas as pd
 
-    data_type = tcga_data.DATA_TYPE_RNASEQ_ZSCORE if use_rna_seq else tcga_data.DATA_TYPE_EXPRESSION_ZSCORE
-    gene_list = pd.read_csv(gene_meta_path)['Gene'].unique()
+    data_type = get_data_type(args)
+    gene_list = pd.read_csv(args.gene_meta_path)['Gene'].unique()
 
-    df = tcga_data.get_data([study_id], data_type, gene_list, cache_dir=cache_dir)
+    df = tcga_data.get_data(args.study_id, data_type, gene_list, cache_dir=args.cache_dir)
 
     return df
 
+
+def is_per_study_output(output_path):
+    """
+    Determine whether results should be written to one file per study rather than combined
+
+    :param output_path: Output path, possibly containing "{study_id}"
+    :return: True if `output_path` contains "{study_id}"
+    """
+    return output_path is not None and STUDY_ID_PLACEHOLDER in output_path
+
+
+def get_study_output_path(output_path, study_id):
+    """
+    Resolve the per-study output path for a study, or None if results should be combined
+
+    :param output_path: Output path, possibly containing "{study_id}"
+    :param study_id: TCGA study identifier
+    :return: Output path for the given study if `output_path` contains "{study_id}", otherwise None
+    """
+    if not is_per_study_output(output_path):
+        return None
+    return output_path.replace(STUDY_ID_PLACEHOLDER, study_id)
+
+
+def get_unique_study_ids(study_ids):
+    """
+    Remove repeated study identifiers while preserving the order they were given in
+
+    :param study_ids: Sequence of TCGA study identifiers
+    :return: List of unique study identifiers
+    """
+    unique_study_ids = list(OrderedDict.fromkeys(study_ids))
+    if len(unique_study_ids) < len(study_ids):
+        logger.warning('Ignoring repeated study ids in "{}"'.format(list(study_ids)))
+    return unique_study_ids
+
+
+def write_csv(df, path):
+    """
+    Write a data frame to CSV through a temporary file in the same directory
+
+    The temporary file is only moved onto `path` once fully written, so an interrupted run never
+    leaves a truncated file behind that could be mistaken for a finished result.
+
+    :param df: Data frame to write
+    :param path: Destination CSV path
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    os.close(fd)
+    try:
+        df.to_csv(tmp_path, index=False)
+
+        # mkstemp creates files readable only by the owner so restore the mode a plain write would have
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_path, 0o666 & ~umask)
+
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def _collect_study(task):
+    # Run data collection for a single, pre-validated study; this runs in worker processes
+    # so all failures are converted to exit codes rather than raised
+    from pycgds import tcga as tcga_data
+
+    study_id, data_type, gene_list, cache_dir, output_path = task
+    try:
+        d = tcga_data.get_study_data(study_id, data_type, gene_list, cache_dir=cache_dir)
+        if d is None:
+            logger.warning('No data found for study id "{}", data type "{}"'.format(study_id, data_type))
+            return StudyResult(study_id, EXIT_NO_DATA, None)
+
+        # Write results directly from the worker when outputs are split by study
+        # to avoid sending the data back to the parent process
+        study_output_path = get_study_output_path(output_path, study_id)
+        if study_output_path is not None:
+            write_csv(tcga_data.prepare_data([d]), study_output_path)
+            logger.info('Wrote expression data for study "{}" to "{}"'.format(study_id, study_output_path))
+            return StudyResult(study_id, EXIT_OK, None)
+        return StudyResult(study_id, EXIT_OK, d)
+    except Exception:
+        logger.exception('Expression data collection failed for study id "{}"'.format(study_id))
+        return StudyResult(study_id, EXIT_FAILED, None)
+
+
+def collect_expression_data(args, output_path=None):
+    """
+    Collect expression data for many studies, fanning out across a local process pool
+
+    Study metadata (known cBioPortal studies and genetic profiles) and the gene list are loaded and validated
+    once in the parent process and shared with all workers, so that only the per-study data collection is
+    run in parallel.
+
+    :param args: Parsed arguments from `add_args`
+    :param output_path: Optional output path; if it contains "{study_id}", results for each study are
+        written to separate files by the workers and not returned
+    :return: List of `StudyResult` in the order studies were given (without repeats); `data` is the raw
+        study frame for successful studies when results are not written per study, and None otherwise
+    """
+    from pycgds import tcga as tcga_data
+    import pandas as pd
+
+    study_ids = get_unique_study_ids(args.study_id)
+    data_type = get_data_type(args)
+    gene_list = pd.read_csv(args.gene_meta_path)['Gene'].unique()
+
+    # Validate all studies up front against a single copy of the cBioPortal metadata
+    try:
+        cancer_study_ids = tcga_data.get_cancer_study_ids()
+    except Exception:
+        logger.exception('Failed to fetch cancer study metadata from cBioPortal')
+        return [StudyResult(study_id, EXIT_FAILED, None) for study_id in study_ids]
+    results = {}
+    tasks = []
+    for study_id in study_ids:
+        try:
+            if not tcga_data.validate_study_id(study_id, data_type, cancer_study_ids):
+                results[study_id] = StudyResult(study_id, EXIT_NO_DATA, None)
+                continue
+        except ValueError as e:
+            logger.error(str(e))
+            results[study_id] = StudyResult(study_id, EXIT_INVALID_STUDY, None)
+            continue
+        except Exception:
+            logger.exception('Validation failed for study id "{}"'.format(study_id))
+            results[study_id] = StudyResult(study_id, EXIT_FAILED, None)
+            continue
+        tasks.append((study_id, data_type, gene_list, args.cache_dir, output_path))
+
+    # Create the cache directory once so that workers never race to create it
+    if args.cache_dir is not None:
+        os.makedirs(args.cache_dir, exist_ok=True)
+
+    logger.info('Beginning data collection for {} TCGA study ids using {} worker(s)'
+                .format(len(tasks), args.workers))
+    if args.workers > 1 and len(tasks) > 1:
+        from multiprocessing import Pool
+        with Pool(min(args.workers, len(tasks))) as pool:
+            study_results = pool.map(_collect_study, tasks, chunksize=1)
+    else:
+        study_results = [_collect_study(task) for task in tasks]
+    results.update({r.study_id: r for r in study_results})
+
+    return [results[study_id] for study_id in study_ids]
@@ -1,7 +1,13 @@
+import os
+import sys
+import csv
 import logging
 from io import StringIO
 from argparse import ArgumentParser
-from pycgds.tcga_expression import add_args, get_expression_data
+from pycgds.tcga_expression import (
+    add_args, collect_expression_data, get_study_output_path, get_unique_study_ids, is_per_study_output, write_csv,
+    StudyResult, EXIT_OK, EXIT_FAILED
+)
 
 logger = logging.getLogger(__name__)
 
@@ -12,21 +18,88 @@ def make_arg_parser():
         "--output",
         required=True,
         metavar='PATH',
-        help="Name of CSV file to contain resulting TCGA expression data"
+        help="Name of CSV file to contain resulting TCGA expression data; if the name contains \"{study_id}\" "
+             "then one file is written per study, otherwise data for all studies is combined into one file"
+    )
+    parser.add_argument(
+        "--status-output",
+        metavar='PATH',
+        help="Optional name of CSV file to contain the exit code for each study"
+    )
+    parser.add_argument(
+        "--skip-existing",
+        action='store_true',
+        help="Skip collection for studies whose output file already exists (exits before loading pandas "
+             "if all outputs exist)"
     )
     return parser
 
+
+def write_status(results, path):
+    # Written with the csv module so that the status can be reported without loading pandas
+    logging.info('TCGA expression study exit codes:\n{}'.format(
+        '\n'.join(['{} {}'.format(r.study_id, r.exit_code) for r in results])
+    ))
+    if path:
+        with open(path, 'w', newline='') as fd:
+            writer = csv.writer(fd)
+            writer.writerow(['StudyId', 'ExitCode'])
+            writer.writerows([(r.study_id, r.exit_code) for r in results])
+
+
 if __name__ == "__main__":
     parser = add_args(make_arg_parser())
     args = parser.parse_args()
     logger.info('TCGA expression arguments: {}'.format(args))
 
+    # Determine which studies already have results
+    study_ids = get_unique_study_ids(args.study_id)
+    args.study_id = study_ids
+    skipped = {}
+    if args.skip_existing:
+        if not is_per_study_output(args.output):
+            if os.path.exists(args.output):
+                skipped = {study_id: StudyResult(study_id, EXIT_OK, None) for study_id in study_ids}
+        else:
+            skipped = {
+                study_id: StudyResult(study_id, EXIT_OK, None) for study_id in study_ids
+                if os.path.exists(get_study_output_path(args.output, study_id))
+            }
+        if len(skipped) > 0:
+            logger.info('Skipping studies with existing output: {}'.format(list(skipped.keys())))
+        args.study_id = [study_id for study_id in study_ids if study_id not in skipped]
+    if len(args.study_id) == 0:
+        write_status([skipped[study_id] for study_id in study_ids], args.status_output)
+        sys.exit(0)
+
     # Run TCGA expression data collection
-    df = get_expression_data(args)
+    results = {r.study_id: r for r in collect_expression_data(args, output_path=args.output)}
+    results.update(skipped)
+    results = [results[study_id] for study_id in study_ids]
+
+    # Combine results into a single file if not already written per study
+    data = [r.data for r in results if r.data is not None]
+    failed = [r.study_id for r in results if r.exit_code != EXIT_OK]
+    if not is_per_study_output(args.output) and len(failed) > 0:
+        # A partial combined file would be taken as complete by --skip-existing on the next run
+        logger.error('Collection did not succeed for studies {} so "{}" will not be written'
+                     .format(failed, args.output))
+    elif len(data) > 0:
+        from pycgds.tcga import prepare_data
+        df = prepare_data(data)
+
+        # Print result info
+        info = StringIO()
+        df.info(buf=info)
+        logging.info('TCGA expression result info:\n{}'.format(info.getvalue()))
 
-    # Print result info
-    info = StringIO()
-    df.info(buf=info)
-    logging.info('TCGA expression result info:\n{}'.format(info.getvalue()))
+        write_csv(df, args.output)
+    elif not is_per_study_output(args.output):
+        logger.error('No TCGA expression data collected for any study so "{}" will not be written'
+                     .format(args.output))
 
-    df.to_csv(args.output, index=False)
\ No newline at end of file
+    # Report exit codes for each study; any failure takes precedence over missing or invalid studies
+    # in the process exit code, with the status file carrying the per-study detail
+    write_status(results, args.status_output)
+    exit_codes = [r.exit_code for r in results]
+    sys.exit(EXIT_FAILED if EXIT_FAILED in exit_codes else max(exit_codes))
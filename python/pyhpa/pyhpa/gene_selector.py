@@ -1,6 +1,4 @@
 
-from pyhpa import data as hpa_data
-
 
 def add_args(parser):
     parser.add_argument(
@@ -20,6 +18,8 @@ def add_args(parser):
 
 
 def select_genes(args):
+    from pyhpa import data as hpa_data
+
     hpa_version = args.hpa_version
     hpa_protein_classes = [
         'FDA approved drug targets', 'Predicted membrane proteins',
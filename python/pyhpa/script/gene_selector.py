@@ -1,4 +1,7 @@
 
+import os
+import sys
+import tempfile
 import logging
 from io import StringIO
 from argparse import ArgumentParser
@@ -15,6 +18,11 @@ def make_arg_parser():
         metavar='PATH',
         help="Name of CSV file to contain resulting selected gene/protein metadata"
     )
+    parser.add_argument(
+        "--skip-existing",
+        action='store_true',
+        help="Exit immediately (before loading pandas) if the output file already exists"
+    )
     return parser
 
 if __name__ == "__main__":
@@ -23,6 +31,10 @@ if __name__ == "__main__":
     args = parser.parse_args()
     logger.info('Gene selection arguments: {}'.format(args))
 
+    if args.skip_existing and os.path.exists(args.output):
+        logger.info('Output "{}" already exists; skipping gene selection'.format(args.output))
+        sys.exit(0)
+
     # Run selection
     df = select_genes(args)
 
@@ -31,5 +43,18 @@ if __name__ == "__main__":
     df.info(buf=info)
     logging.info('Gene selection result info:\n{}'.format(info.getvalue()))
 
-    # Write results to file
-    df.to_csv(args.output, index=False)
\ No newline at end of file
+    # Write results to a temporary file first so that an interrupted run is never taken as complete
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(args.output) or '.', suffix='.tmp')
+    os.close(fd)
+    try:
+        df.to_csv(tmp_path, index=False)
+
+        # mkstemp creates files readable only by the owner so restore the mode a plain write would have
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_path, 0o666 & ~umask)
+
+        os.replace(tmp_path, args.output)
+    except BaseException:
+        os.remove(tmp_path)
+        raise